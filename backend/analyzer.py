@@ -1,33 +1,40 @@
 """
-Flask API for Stock Pattern Analysis with AI Insights
+Quart (ASGI) API for Stock Pattern Analysis with AI Insights
 Endpoint: http://localhost:8000/analyze?symbol=TCS.NS&period=6mo&lookback=5&top_n=5
+Serve with an ASGI server, e.g. `uvicorn analyzer:app --port 8000 --workers 4`
 """
 import ta
 import yfinance as yf
-import requests
 import time
 import os
 import pandas_ta as ta
-from flask import Flask, jsonify,request
+import asyncio
+import httpx
+from quart import Quart, request
+from quart_cors import cors
 import os
-from flask import Flask, jsonify, request
-from flask_cors import CORS
 import mysql.connector
 from bs4 import BeautifulSoup
 import pytz
-from flask_cors import CORS
 import mysql.connector
 import json
+import hashlib
+try:
+    import orjson
+except ImportError:  # fall back to stdlib json after convert_to_json_serializable
+    orjson = None
+import re
 import traceback
 from datetime import datetime
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import requests
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import heapq
+import threading
+from functools import lru_cache
+from cachetools import LRUCache, TTLCache
 from datetime import datetime, timedelta
-from scipy.spatial.distance import euclidean
-from fastdtw import fastdtw
+from numba import njit, prange
 from langchain_openai import AzureChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 import os
@@ -36,8 +43,39 @@ from typing import List, Dict, Optional
 
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
+app = cors(Quart(__name__))
+
+# Shared upstream HTTP client, opened and closed with the server lifecycle
+http_client: Optional[httpx.AsyncClient] = None
+
+@app.before_serving
+async def open_http_client():
+    global http_client
+    http_client = httpx.AsyncClient(timeout=30)
+
+@app.after_serving
+async def close_http_client():
+    await http_client.aclose()
+
+def to_json_bytes(obj):
+    """Serialize to JSON bytes; orjson handles numpy scalars and arrays natively"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(convert_to_json_serializable(obj)).encode()
+
+def jresp(obj, code=200):
+    """JSON response built with to_json_bytes"""
+    return app.response_class(to_json_bytes(obj), code, mimetype='application/json')
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header lists etag, using the weak comparison RFC 9110 requires
+
+    Proxies that re-encode the body turn a strong tag into W/"...", so the prefix is ignored.
+    """
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    return '*' in tags or etag.removeprefix('W/') in tags
 
 # ==========================================
 # PATTERN MATCHING CORE LOGIC
@@ -47,8 +85,6 @@ CORS(app)
 # ==========================================
 def convert_to_json_serializable(obj):
     """Recursively convert numpy types to native Python types"""
-    import numpy as np
-    
     if isinstance(obj, dict):
         return {k: convert_to_json_serializable(v) for k, v in obj.items()}
     elif isinstance(obj, list):
@@ -70,6 +106,146 @@ class PatternType:
     REVERSAL_BULLISH = "reversal_bullish"
     REVERSAL_BEARISH = "reversal_bearish"
 
+# Candlestick pattern catalogue, in detection order. Components name the
+# (column, offset from the signal candle) values reported with each match.
+CANDLE_PATTERNS = (
+    # Single candle
+    {'name': 'Doji', 'type': PatternType.NEUTRAL, 'confidence': 75,
+     'description': 'Market indecision - potential reversal point',
+     'reliability': 'Medium', 'confirmation': False,
+     'components': {'price': ('close', 0)}},
+    {'name': 'Hammer', 'type': PatternType.REVERSAL_BULLISH, 'confidence': 80,
+     'description': 'Bullish reversal - buyers rejected lower prices',
+     'reliability': 'High', 'confirmation': False,
+     'components': {'price': ('close', 0), 'low': ('low', 0)}},
+    {'name': 'Shooting Star', 'type': PatternType.REVERSAL_BEARISH, 'confidence': 80,
+     'description': 'Bearish reversal - sellers rejected higher prices',
+     'reliability': 'High', 'confirmation': False,
+     'components': {'price': ('close', 0), 'high': ('high', 0)}},
+    {'name': 'Spinning Top', 'type': PatternType.NEUTRAL, 'confidence': 65,
+     'description': 'Indecision - balance between buyers and sellers',
+     'reliability': 'Low', 'confirmation': False,
+     'components': {'price': ('close', 0)}},
+    # Two candles
+    {'name': 'Bullish Engulfing', 'type': PatternType.REVERSAL_BULLISH, 'confidence': 85,
+     'description': 'Strong bullish reversal - buyers overwhelm sellers',
+     'reliability': 'High', 'confirmation': False,
+     'components': {'prev_close': ('close', -1), 'curr_close': ('close', 0)}},
+    {'name': 'Bearish Engulfing', 'type': PatternType.REVERSAL_BEARISH, 'confidence': 85,
+     'description': 'Strong bearish reversal - sellers overwhelm buyers',
+     'reliability': 'High', 'confirmation': False,
+     'components': {'prev_close': ('close', -1), 'curr_close': ('close', 0)}},
+    {'name': 'Bullish Harami', 'type': PatternType.REVERSAL_BULLISH, 'confidence': 70,
+     'description': 'Potential bullish reversal - selling pressure weakening',
+     'reliability': 'Medium', 'confirmation': False,
+     'components': {'prev_close': ('close', -1), 'curr_close': ('close', 0)}},
+    {'name': 'Bearish Harami', 'type': PatternType.REVERSAL_BEARISH, 'confidence': 70,
+     'description': 'Potential bearish reversal - buying pressure weakening',
+     'reliability': 'Medium', 'confirmation': False,
+     'components': {'prev_close': ('close', -1), 'curr_close': ('close', 0)}},
+    {'name': 'Piercing Line', 'type': PatternType.REVERSAL_BULLISH, 'confidence': 75,
+     'description': 'Bullish reversal - strong buying after gap down',
+     'reliability': 'Medium', 'confirmation': False,
+     'components': {'prev_close': ('close', -1), 'curr_close': ('close', 0)}},
+    {'name': 'Dark Cloud Cover', 'type': PatternType.REVERSAL_BEARISH, 'confidence': 75,
+     'description': 'Bearish reversal - strong selling after gap up',
+     'reliability': 'Medium', 'confirmation': False,
+     'components': {'prev_close': ('close', -1), 'curr_close': ('close', 0)}},
+    # Three candles
+    {'name': 'Morning Star', 'type': PatternType.REVERSAL_BULLISH, 'confidence': 90,
+     'description': 'Strong bullish reversal - trend change confirmed',
+     'reliability': 'High', 'confirmation': True,
+     'components': {'c1_close': ('close', -2), 'c2_close': ('close', -1), 'c3_close': ('close', 0)}},
+    {'name': 'Evening Star', 'type': PatternType.REVERSAL_BEARISH, 'confidence': 90,
+     'description': 'Strong bearish reversal - trend change confirmed',
+     'reliability': 'High', 'confirmation': True,
+     'components': {'c1_close': ('close', -2), 'c2_close': ('close', -1), 'c3_close': ('close', 0)}},
+    {'name': 'Three White Soldiers', 'type': PatternType.BULLISH, 'confidence': 85,
+     'description': 'Strong bullish momentum - sustained buying pressure',
+     'reliability': 'High', 'confirmation': True,
+     'components': {'c1_close': ('close', -2), 'c2_close': ('close', -1), 'c3_close': ('close', 0)}},
+    {'name': 'Three Black Crows', 'type': PatternType.BEARISH, 'confidence': 85,
+     'description': 'Strong bearish momentum - sustained selling pressure',
+     'reliability': 'High', 'confirmation': True,
+     'components': {'c1_close': ('close', -2), 'c2_close': ('close', -1), 'c3_close': ('close', 0)}},
+)
+N_CANDLE_PATTERNS = len(CANDLE_PATTERNS)
+
+@njit(cache=True)
+def detect_candles(o, h, l, c, body, upper, lower, ratio, bull,
+                   doji_threshold, long_shadow_ratio, min_body_ratio, engulfing_threshold):
+    """Single scan over the bars; returns (pattern id, bar index) of every hit
+
+    Ids index CANDLE_PATTERNS and hits come out bar by bar, in catalogue order.
+    """
+    n = len(c)
+    n_patterns = N_CANDLE_PATTERNS
+    pattern_ids = np.empty(max(n - 2, 0) * n_patterns, dtype=np.int64)
+    indices = np.empty_like(pattern_ids)
+    hit = np.zeros(n_patterns, dtype=np.bool_)
+    count = 0
+
+    for i in range(2, n):
+        p1 = i - 1
+        p2 = i - 2
+        mid1 = (o[p1] + c[p1]) / 2
+        mid2 = (o[p2] + c[p2]) / 2
+
+        # Predicates combine with & rather than `and`, so every candle evaluates the
+        # same branch-free comparisons
+        bear = not bull[i]
+        bear1 = not bull[p1]
+        bear2 = not bull[p2]
+
+        # 1. DOJI - Small body, indecision
+        hit[0] = ratio[i] < doji_threshold
+        # 2. HAMMER - Long lower shadow, small body at top (bullish reversal)
+        hit[1] = ((lower[i] > body[i] * long_shadow_ratio) & (upper[i] < body[i] * 0.3) &
+                  (ratio[i] > min_body_ratio))
+        # 3. SHOOTING STAR - Long upper shadow, small body at bottom (bearish reversal)
+        hit[2] = ((upper[i] > body[i] * long_shadow_ratio) & (lower[i] < body[i] * 0.3) &
+                  (ratio[i] > min_body_ratio))
+        # 4. SPINNING TOP - Small body, long shadows both sides
+        hit[3] = (ratio[i] < 0.3) & (upper[i] > body[i]) & (lower[i] > body[i])
+        # 5. BULLISH ENGULFING - Large bullish candle engulfs previous bearish
+        hit[4] = (bear1 & bull[i] & (o[i] <= c[p1]) & (c[i] >= o[p1]) &
+                  (body[i] > body[p1] * engulfing_threshold))
+        # 6. BEARISH ENGULFING - Large bearish candle engulfs previous bullish
+        hit[5] = (bull[p1] & bear & (o[i] >= c[p1]) & (c[i] <= o[p1]) &
+                  (body[i] > body[p1] * engulfing_threshold))
+        # 7. BULLISH HARAMI - Small bullish candle within previous large bearish
+        hit[6] = (bear1 & bull[i] & (o[i] >= c[p1]) & (c[i] <= o[p1]) &
+                  (body[i] < body[p1] * 0.5))
+        # 8. BEARISH HARAMI - Small bearish candle within previous large bullish
+        hit[7] = (bull[p1] & bear & (o[i] <= c[p1]) & (c[i] >= o[p1]) &
+                  (body[i] < body[p1] * 0.5))
+        # 9. PIERCING LINE - Bullish reversal at downtrend bottom
+        hit[8] = bear1 & bull[i] & (o[i] < l[p1]) & (c[i] > mid1) & (c[i] < o[p1])
+        # 10. DARK CLOUD COVER - Bearish reversal at uptrend top
+        hit[9] = bull[p1] & bear & (o[i] > h[p1]) & (c[i] < mid1) & (c[i] > o[p1])
+        # 11. MORNING STAR - Bullish reversal (bearish, doji/small, bullish)
+        hit[10] = bear2 & (ratio[p1] < 0.3) & bull[i] & (c[i] > mid2)
+        # 12. EVENING STAR - Bearish reversal (bullish, doji/small, bearish)
+        hit[11] = bull[p2] & (ratio[p1] < 0.3) & bear & (c[i] < mid2)
+        # 13. THREE WHITE SOLDIERS - Bullish continuation (3 consecutive bullish)
+        hit[12] = (bull[p2] & bull[p1] & bull[i] & (c[p1] > c[p2]) & (c[i] > c[p1]) &
+                   (ratio[p2] > 0.5) & (ratio[p1] > 0.5) & (ratio[i] > 0.5))
+        # 14. THREE BLACK CROWS - Bearish continuation (3 consecutive bearish)
+        hit[13] = (bear2 & bear1 & bear & (c[p1] < c[p2]) & (c[i] < c[p1]) &
+                   (ratio[p2] > 0.5) & (ratio[p1] > 0.5) & (ratio[i] > 0.5))
+
+        for pid in range(n_patterns):
+            if hit[pid]:
+                pattern_ids[count] = pid
+                indices[count] = i
+                count += 1
+
+    return pattern_ids[:count], indices[:count]
+
+# Compile at import so the first request doesn't pay the JIT cost
+_warm_bars = np.zeros(3)
+detect_candles(*(_warm_bars,) * 8, np.zeros(3, dtype=np.bool_), 0.05, 2.0, 0.1, 0.9)
+
 class CandlestickPatternDetector:
     """Detects classical candlestick patterns"""
     
@@ -78,374 +254,63 @@ class CandlestickPatternDetector:
         self.doji_threshold = 0.05
         self.long_shadow_ratio = 2.0
         self.engulfing_threshold = 0.9
-    def _detect_single_patterns(self, df, i) -> List[Dict]:
-        """Detect single candlestick patterns"""
-        patterns = []
-        row = df.iloc[i]
-        metrics = self._get_candle_metrics(row)
-        date = row['date'].strftime('%Y-%m-%d')
-        
-        # 1. DOJI - Small body, indecision
-        if metrics['body_ratio'] < self.doji_threshold:
-            patterns.append({
-                'name': 'Doji',
-                'type': PatternType.NEUTRAL,
-                'confidence': 75,
-                'date': date,
-                'index': i,
-                'description': 'Market indecision - potential reversal point',
-                'reliability': 'Medium',
-                'confirmation': False,
-                'components': {'price': metrics['close']}
-            })
-        
-        # 2. HAMMER - Long lower shadow, small body at top (bullish reversal)
-        if (metrics['lower_shadow'] > metrics['body'] * self.long_shadow_ratio and
-            metrics['upper_shadow'] < metrics['body'] * 0.3 and
-            metrics['body_ratio'] > self.min_body_ratio):
-            
-            patterns.append({
-                'name': 'Hammer',
-                'type': PatternType.REVERSAL_BULLISH,
-                'confidence': 80,
-                'date': date,
-                'index': i,
-                'description': 'Bullish reversal - buyers rejected lower prices',
-                'reliability': 'High',
-                'confirmation': False,
-                'components': {'price': metrics['close'], 'low': metrics['low']}
-            })
-        
-        # 3. SHOOTING STAR - Long upper shadow, small body at bottom (bearish reversal)
-        if (metrics['upper_shadow'] > metrics['body'] * self.long_shadow_ratio and
-            metrics['lower_shadow'] < metrics['body'] * 0.3 and
-            metrics['body_ratio'] > self.min_body_ratio):
-            
-            patterns.append({
-                'name': 'Shooting Star',
-                'type': PatternType.REVERSAL_BEARISH,
-                'confidence': 80,
-                'date': date,
-                'index': i,
-                'description': 'Bearish reversal - sellers rejected higher prices',
-                'reliability': 'High',
-                'confirmation': False,
-                'components': {'price': metrics['close'], 'high': metrics['high']}
-            })
-        
-        # 4. SPINNING TOP - Small body, long shadows both sides
-        if (metrics['body_ratio'] < 0.3 and
-            metrics['upper_shadow'] > metrics['body'] and
-            metrics['lower_shadow'] > metrics['body']):
-            
-            patterns.append({
-                'name': 'Spinning Top',
-                'type': PatternType.NEUTRAL,
-                'confidence': 65,
-                'date': date,
-                'index': i,
-                'description': 'Indecision - balance between buyers and sellers',
-                'reliability': 'Low',
-                'confirmation': False,
-                'components': {'price': metrics['close']}
-            })
-        
-        return patterns    
-    def detect_all_patterns(self, df: pd.DataFrame) -> List[Dict]:
-        """Scan entire dataframe for all patterns"""
-        all_patterns = []
-        
-        for i in range(2, len(df)):
-            # Single candle patterns
-            all_patterns.extend(self._detect_single_patterns(df, i))
-            
-            # Two candle patterns (need previous candle)
-            if i >= 1:
-                all_patterns.extend(self._detect_two_candle_patterns(df, i))
-            
-            # Three candle patterns (need 2 previous candles)
-            if i >= 2:
-                all_patterns.extend(self._detect_three_candle_patterns(df, i))
-        
-        return all_patterns
     
-    def _get_candle_metrics(self, row):
-        """Calculate candlestick metrics"""
-        o, h, l, c = row['open'], row['high'], row['low'], row['close']
-        
-        body = abs(c - o)
-        total_range = h - l
-        upper_shadow = h - max(c, o)
-        lower_shadow = min(c, o) - l
-        
-        is_bullish = bool(c > o)  # ← Convert to native Python bool
-        
+    def prepare(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """Candle metrics for every bar, one array per field"""
+        o, h, l, c = (df[k].to_numpy(np.float64) for k in OHLC_COLUMNS)
+        body = np.abs(c - o)
         return {
-            'open': float(o), 
-            'high': float(h), 
-            'low': float(l), 
-            'close': float(c),
-            'body': float(body),
-            'range': float(total_range),
-            'upper_shadow': float(upper_shadow),
-            'lower_shadow': float(lower_shadow),
-            'is_bullish': is_bullish,
-            'body_ratio': float(body / (total_range + 1e-9))
+            'open': o,
+            'high': h,
+            'low': l,
+            'close': c,
+            'body': body,
+            'upper_shadow': h - np.maximum(c, o),
+            'lower_shadow': np.minimum(c, o) - l,
+            'body_ratio': body / (h - l + 1e-9),
+            'is_bullish': c > o,
         }
-    def _detect_two_candle_patterns(self, df, i) -> List[Dict]:
-        """Detect two-candle patterns"""
-        patterns = []
-        
-        prev_row = df.iloc[i-1]
-        curr_row = df.iloc[i]
-        
-        prev_metrics = self._get_candle_metrics(prev_row)
-        curr_metrics = self._get_candle_metrics(curr_row)
-        
-        date = curr_row['date'].strftime('%Y-%m-%d')
-        
-        # 1. BULLISH ENGULFING - Large bullish candle engulfs previous bearish
-        if (not prev_metrics['is_bullish'] and curr_metrics['is_bullish'] and
-            curr_metrics['open'] <= prev_metrics['close'] and
-            curr_metrics['close'] >= prev_metrics['open'] and
-            curr_metrics['body'] > prev_metrics['body'] * self.engulfing_threshold):
-            
-            patterns.append({
-                'name': 'Bullish Engulfing',
-                'type': PatternType.REVERSAL_BULLISH,
-                'confidence': 85,
-                'date': date,
-                'index': i,
-                'description': 'Strong bullish reversal - buyers overwhelm sellers',
-                'reliability': 'High',
-                'confirmation': False,
-                'components': {
-                    'prev_close': prev_metrics['close'],
-                    'curr_close': curr_metrics['close']
-                }
-            })
-        
-        # 2. BEARISH ENGULFING - Large bearish candle engulfs previous bullish
-        if (prev_metrics['is_bullish'] and not curr_metrics['is_bullish'] and
-            curr_metrics['open'] >= prev_metrics['close'] and
-            curr_metrics['close'] <= prev_metrics['open'] and
-            curr_metrics['body'] > prev_metrics['body'] * self.engulfing_threshold):
-            
-            patterns.append({
-                'name': 'Bearish Engulfing',
-                'type': PatternType.REVERSAL_BEARISH,
-                'confidence': 85,
-                'date': date,
-                'index': i,
-                'description': 'Strong bearish reversal - sellers overwhelm buyers',
-                'reliability': 'High',
-                'confirmation': False,
-                'components': {
-                    'prev_close': prev_metrics['close'],
-                    'curr_close': curr_metrics['close']
-                }
-            })
-        
-        # 3. BULLISH HARAMI - Small bullish candle within previous large bearish
-        if (not prev_metrics['is_bullish'] and curr_metrics['is_bullish'] and
-            curr_metrics['open'] >= prev_metrics['close'] and
-            curr_metrics['close'] <= prev_metrics['open'] and
-            curr_metrics['body'] < prev_metrics['body'] * 0.5):
-            
-            patterns.append({
-                'name': 'Bullish Harami',
-                'type': PatternType.REVERSAL_BULLISH,
-                'confidence': 70,
-                'date': date,
-                'index': i,
-                'description': 'Potential bullish reversal - selling pressure weakening',
-                'reliability': 'Medium',
-                'confirmation': False,
-                'components': {
-                    'prev_close': prev_metrics['close'],
-                    'curr_close': curr_metrics['close']
-                }
-            })
-        
-        # 4. BEARISH HARAMI - Small bearish candle within previous large bullish
-        if (prev_metrics['is_bullish'] and not curr_metrics['is_bullish'] and
-            curr_metrics['open'] <= prev_metrics['close'] and
-            curr_metrics['close'] >= prev_metrics['open'] and
-            curr_metrics['body'] < prev_metrics['body'] * 0.5):
-            
-            patterns.append({
-                'name': 'Bearish Harami',
-                'type': PatternType.REVERSAL_BEARISH,
-                'confidence': 70,
-                'date': date,
-                'index': i,
-                'description': 'Potential bearish reversal - buying pressure weakening',
-                'reliability': 'Medium',
-                'confirmation': False,
-                'components': {
-                    'prev_close': prev_metrics['close'],
-                    'curr_close': curr_metrics['close']
-                }
-            })
-        
-        # 5. PIERCING LINE - Bullish reversal at downtrend bottom
-        if (not prev_metrics['is_bullish'] and curr_metrics['is_bullish'] and
-            curr_metrics['open'] < prev_metrics['low'] and
-            curr_metrics['close'] > (prev_metrics['open'] + prev_metrics['close']) / 2 and
-            curr_metrics['close'] < prev_metrics['open']):
-            
-            patterns.append({
-                'name': 'Piercing Line',
-                'type': PatternType.REVERSAL_BULLISH,
-                'confidence': 75,
-                'date': date,
-                'index': i,
-                'description': 'Bullish reversal - strong buying after gap down',
-                'reliability': 'Medium',
-                'confirmation': False,
-                'components': {
-                    'prev_close': prev_metrics['close'],
-                    'curr_close': curr_metrics['close']
-                }
-            })
-        
-        # 6. DARK CLOUD COVER - Bearish reversal at uptrend top
-        if (prev_metrics['is_bullish'] and not curr_metrics['is_bullish'] and
-            curr_metrics['open'] > prev_metrics['high'] and
-            curr_metrics['close'] < (prev_metrics['open'] + prev_metrics['close']) / 2 and
-            curr_metrics['close'] > prev_metrics['open']):
-            
-            patterns.append({
-                'name': 'Dark Cloud Cover',
-                'type': PatternType.REVERSAL_BEARISH,
-                'confidence': 75,
-                'date': date,
-                'index': i,
-                'description': 'Bearish reversal - strong selling after gap up',
-                'reliability': 'Medium',
-                'confirmation': False,
-                'components': {
-                    'prev_close': prev_metrics['close'],
-                    'curr_close': curr_metrics['close']
-                }
-            })
-        
-        return patterns
-    def convert_to_json_serializable(obj):
-        """Recursively convert numpy types to native Python types"""
-        import numpy as np
-        
-        if isinstance(obj, dict):
-            return {k: convert_to_json_serializable(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [convert_to_json_serializable(item) for item in obj]
-        elif isinstance(obj, np.bool_):
-            return bool(obj)
-        elif isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        else:
-            return obj
-    def _detect_three_candle_patterns(self, df, i) -> List[Dict]:
-        """Detect three-candle patterns"""
-        patterns = []
-        
-        c1 = self._get_candle_metrics(df.iloc[i-2])
-        c2 = self._get_candle_metrics(df.iloc[i-1])
-        c3 = self._get_candle_metrics(df.iloc[i])
-        
-        date = df.iloc[i]['date'].strftime('%Y-%m-%d')
-        
-        # 1. MORNING STAR - Bullish reversal (bearish, doji/small, bullish)
-        if (not c1['is_bullish'] and 
-            c2['body_ratio'] < 0.3 and
-            c3['is_bullish'] and
-            c3['close'] > (c1['open'] + c1['close']) / 2):
-            
-            patterns.append({
-                'name': 'Morning Star',
-                'type': PatternType.REVERSAL_BULLISH,
-                'confidence': 90,
-                'date': date,
-                'index': i,
-                'description': 'Strong bullish reversal - trend change confirmed',
-                'reliability': 'High',
-                'confirmation': True,
-                'components': {
-                    'c1_close': c1['close'],
-                    'c2_close': c2['close'],
-                    'c3_close': c3['close']
-                }
-            })
-        
-        # 2. EVENING STAR - Bearish reversal (bullish, doji/small, bearish)
-        if (c1['is_bullish'] and 
-            c2['body_ratio'] < 0.3 and
-            not c3['is_bullish'] and
-            c3['close'] < (c1['open'] + c1['close']) / 2):
-            
-            patterns.append({
-                'name': 'Evening Star',
-                'type': PatternType.REVERSAL_BEARISH,
-                'confidence': 90,
-                'date': date,
-                'index': i,
-                'description': 'Strong bearish reversal - trend change confirmed',
-                'reliability': 'High',
-                'confirmation': True,
-                'components': {
-                    'c1_close': c1['close'],
-                    'c2_close': c2['close'],
-                    'c3_close': c3['close']
-                }
-            })
+    
+    def detect_all_patterns(self, df: pd.DataFrame) -> List[Dict]:
+        """Scan entire dataframe for all patterns"""
+        if len(df) < 3:
+            return []
         
-        # 3. THREE WHITE SOLDIERS - Bullish continuation (3 consecutive bullish)
-        if (c1['is_bullish'] and c2['is_bullish'] and c3['is_bullish'] and
-            c2['close'] > c1['close'] and c3['close'] > c2['close'] and
-            c1['body_ratio'] > 0.5 and c2['body_ratio'] > 0.5 and c3['body_ratio'] > 0.5):
-            
-            patterns.append({
-                'name': 'Three White Soldiers',
-                'type': PatternType.BULLISH,
-                'confidence': 85,
-                'date': date,
-                'index': i,
-                'description': 'Strong bullish momentum - sustained buying pressure',
-                'reliability': 'High',
-                'confirmation': True,
-                'components': {
-                    'c1_close': c1['close'],
-                    'c2_close': c2['close'],
-                    'c3_close': c3['close']
-                }
-            })
+        candles = self.prepare(df)
+        pattern_ids, indices = detect_candles(
+            candles['open'], candles['high'], candles['low'], candles['close'],
+            candles['body'], candles['upper_shadow'], candles['lower_shadow'],
+            candles['body_ratio'], candles['is_bullish'],
+            self.doji_threshold, self.long_shadow_ratio,
+            self.min_body_ratio, self.engulfing_threshold
+        )
+        if len(indices) == 0:
+            return []
+        dates = df['date'].iloc[indices].dt.strftime('%Y-%m-%d').to_numpy()
         
-        # 4. THREE BLACK CROWS - Bearish continuation (3 consecutive bearish)
-        if (not c1['is_bullish'] and not c2['is_bullish'] and not c3['is_bullish'] and
-            c2['close'] < c1['close'] and c3['close'] < c2['close'] and
-            c1['body_ratio'] > 0.5 and c2['body_ratio'] > 0.5 and c3['body_ratio'] > 0.5):
-            
-            patterns.append({
-                'name': 'Three Black Crows',
-                'type': PatternType.BEARISH,
-                'confidence': 85,
+        all_patterns = []
+        for i, pid, date in zip(indices.tolist(), pattern_ids.tolist(), dates):
+            spec = CANDLE_PATTERNS[pid]
+            all_patterns.append({
+                'name': spec['name'],
+                'type': spec['type'],
+                'confidence': spec['confidence'],
                 'date': date,
                 'index': i,
-                'description': 'Strong bearish momentum - sustained selling pressure',
-                'reliability': 'High',
-                'confirmation': True,
+                'description': spec['description'],
+                'reliability': spec['reliability'],
+                'confirmation': spec['confirmation'],
                 'components': {
-                    'c1_close': c1['close'],
-                    'c2_close': c2['close'],
-                    'c3_close': c3['close']
+                    key: float(candles[col][i + offset])
+                    for key, (col, offset) in spec['components'].items()
                 }
             })
         
-        return patterns
+        return all_patterns
+
+# Holds only fixed thresholds, so one instance serves every request
+_DETECTOR = CandlestickPatternDetector()
+
 class PatternValidator:
     """Validates candlestick patterns with volume and trend context"""
     
@@ -456,6 +321,8 @@ class PatternValidator:
     def validate_patterns(self, patterns: List[Dict], df: pd.DataFrame) -> List[Dict]:
         """Add confirmation signals to detected patterns"""
         validated = []
+        trends = self._get_trends(df)
+        volume_confirmations = self._check_volumes(df)
         
         for pattern in patterns:
             idx = pattern['index']
@@ -466,10 +333,10 @@ class PatternValidator:
                 continue
             
             # Get trend context
-            trend = self._get_trend(df, idx)
+            trend = trends[idx]
             
             # Get volume confirmation
-            volume_confirmed = self._check_volume(df, idx)
+            volume_confirmed = bool(volume_confirmations[idx])
             
             # Add validation data
             pattern['trend_context'] = trend
@@ -484,35 +351,43 @@ class PatternValidator:
         
         return validated
     
-    def _get_trend(self, df: pd.DataFrame, idx: int) -> str:
-        """Determine if we're in uptrend, downtrend, or sideways"""
-        if idx < self.trend_period:
-            return "unknown"
-        
-        recent_closes = df['close'].iloc[idx - self.trend_period:idx].values
-        sma = np.mean(recent_closes)
-        current_price = df['close'].iloc[idx]
-        
-        # Calculate trend strength
-        slope = np.polyfit(range(len(recent_closes)), recent_closes, 1)[0]
-        
-        if slope > 0 and current_price > sma * 1.02:
-            return "uptrend"
-        elif slope < 0 and current_price < sma * 0.98:
-            return "downtrend"
-        else:
-            return "sideways"
+    def _get_trends(self, df: pd.DataFrame) -> np.ndarray:
+        """Uptrend, downtrend, or sideways at every bar, from the trend_period bars before it"""
+        period = self.trend_period
+        close = df['close'].to_numpy(np.float64)
+        trends = np.full(len(close), "unknown", dtype=object)
+        if len(close) <= period:
+            return trends
+        
+        # Window k holds the closes before bar k + period
+        windows = sliding_window_view(close[:-1], period)
+        sma = windows.mean(axis=1)
+        current_price = close[period:]
+        
+        # Least-squares slope in closed form: cov(t, close) / var(t). The time axis is
+        # centred (sums to zero), so the window mean drops out and it's one matvec.
+        t = np.arange(period) - (period - 1) / 2
+        slope = (windows @ t) / (t @ t)
+        
+        trends[period:] = np.where(
+            (slope > 0) & (current_price > sma * 1.02), "uptrend",
+            np.where((slope < 0) & (current_price < sma * 0.98), "downtrend", "sideways")
+        )
+        return trends
     
-    def _check_volume(self, df: pd.DataFrame, idx: int) -> bool:
-        """Check if volume confirms the pattern"""
-        if idx < self.volume_period or 'volume' not in df.columns:
-            return False
+    def _check_volumes(self, df: pd.DataFrame) -> np.ndarray:
+        """Whether volume confirms a pattern at each bar"""
+        period = self.volume_period
+        confirmed = np.zeros(len(df), dtype=bool)
+        if 'volume' not in df.columns or len(df) <= period:
+            return confirmed
         
-        current_volume = df['volume'].iloc[idx]
-        avg_volume = df['volume'].iloc[idx - self.volume_period:idx].mean()
+        volume = df['volume'].to_numpy(np.float64)
+        avg_volume = sliding_window_view(volume[:-1], period).mean(axis=1)
         
         # Volume should be at least 1.2x average for confirmation
-        return current_volume > avg_volume * 1.2
+        confirmed[period:] = volume[period:] > avg_volume * 1.2
+        return confirmed
     
     def _is_trend_appropriate(self, pattern: Dict, trend: str) -> bool:
         """Check if pattern makes sense in current trend context"""
@@ -535,6 +410,10 @@ class PatternValidator:
         
         # Neutral patterns work in any trend
         return True
+
+# Stateless apart from its periods; shared across requests like _DETECTOR
+_VALIDATOR = PatternValidator()
+
 def calculate_pattern_statistics(patterns: List[Dict], df: pd.DataFrame) -> Dict:
     """Calculate historical success rates for detected patterns"""
     
@@ -544,140 +423,365 @@ def calculate_pattern_statistics(patterns: List[Dict], df: pd.DataFrame) -> Dict
     stats = {}
     horizons = [1, 3, 5, 7, 10]  # Days ahead to check
     
-    for pattern in patterns:
-        pattern_name = pattern['name']
-        pattern_type = pattern['type']
-        idx = pattern['index']
-        
-        if pattern_name not in stats:
-            stats[pattern_name] = {
-                'count': 0,
-                'type': pattern_type,
-                'outcomes': {f'{h}d': [] for h in horizons}
-            }
-        
-        stats[pattern_name]['count'] += 1
-        
-        # Calculate future returns for this pattern occurrence
-        for horizon in horizons:
-            future_idx = idx + horizon
-            
-            if future_idx < len(df):
-                base_price = df['close'].iloc[idx]
-                future_price = df['close'].iloc[future_idx]
-                return_pct = ((future_price - base_price) / base_price) * 100
-                
-                stats[pattern_name]['outcomes'][f'{horizon}d'].append(return_pct)
+    # Forward returns of every occurrence at every horizon, NaN past the end of the data
+    close = df['close'].to_numpy(np.float64)
+    idxs = np.array([p['index'] for p in patterns])
+    future = idxs[:, None] + np.array(horizons)
+    base = close[idxs][:, None]
+    returns = np.where(
+        future < len(close),
+        (close[np.minimum(future, len(close) - 1)] - base) / base * 100,
+        np.nan
+    )
     
-    # Calculate summary statistics
-    for pattern_name in stats:
-        for horizon in [f'{h}d' for h in horizons]:
-            outcomes = stats[pattern_name]['outcomes'][horizon]
+    # Group occurrences by pattern name, in order of first appearance
+    codes, names = pd.factorize(np.array([p['name'] for p in patterns]))
+    
+    for g, pattern_name in enumerate(names):
+        rows = np.flatnonzero(codes == g)
+        stats[pattern_name] = {
+            'count': len(rows),
+            'type': patterns[rows[0]]['type'],
+            'outcomes': {}
+        }
+        
+        # Calculate summary statistics
+        for j, horizon in enumerate(horizons):
+            outcomes = returns[rows, j]
+            outcomes = outcomes[~np.isnan(outcomes)]
             
-            if outcomes:
-                stats[pattern_name]['outcomes'][horizon] = {
+            if len(outcomes):
+                gains = outcomes[outcomes > 0]
+                losses = outcomes[outcomes < 0]
+                stats[pattern_name]['outcomes'][f'{horizon}d'] = {
                     'mean': round(np.mean(outcomes), 2),
                     'median': round(np.median(outcomes), 2),
-                    'success_rate': round(sum(1 for x in outcomes if x > 0) / len(outcomes) * 100, 1),
-                    'avg_gain': round(np.mean([x for x in outcomes if x > 0]), 2) if any(x > 0 for x in outcomes) else 0,
-                    'avg_loss': round(np.mean([x for x in outcomes if x < 0]), 2) if any(x < 0 for x in outcomes) else 0,
+                    'success_rate': round(len(gains) / len(outcomes) * 100, 1),
+                    'avg_gain': round(np.mean(gains), 2) if len(gains) else 0,
+                    'avg_loss': round(np.mean(losses), 2) if len(losses) else 0,
                     'count': len(outcomes)
                 }
             else:
-                stats[pattern_name]['outcomes'][horizon] = None
+                stats[pattern_name]['outcomes'][f'{horizon}d'] = None
     
     return stats
-def mmps_similarity(query_df, candidate_df):
-    """Multi-Metric Pattern Similarity (MMPS) - Returns score 0-100"""
-    L = min(len(query_df), len(candidate_df))
-    d1 = query_df.iloc[-L:].reset_index(drop=True)
-    d2 = candidate_df.iloc[-L:].reset_index(drop=True)
-
-    # 1. SHAPE (Euclidean, normalized)
-    c1 = d1['close'].values
-    c2 = d2['close'].values
-    n1 = (c1 - c1.min()) / (c1.max() - c1.min() + 1e-9)
-    n2 = (c2 - c2.min()) / (c2.max() - c2.min() + 1e-9)
-    shape_dist = np.linalg.norm(n1 - n2)
-    shape_sim = np.exp(-1.5 * shape_dist)
-
-    # 2. DTW
-    n1_2d = n1.reshape(-1, 1)
-    n2_2d = n2.reshape(-1, 1)
-    dtw_dist, _ = fastdtw(n1_2d, n2_2d, dist=euclidean)
-    dtw_sim = np.exp(-0.5 * dtw_dist)
-
-    # 3. STRUCTURE (body/upper/lower)
-    def feats(df):
-        o = df['open'].values
-        h = df['high'].values
-        l = df['low'].values
-        c = df['close'].values
-        rng = (h - l) + 1e-9
-        return np.vstack([
-            np.abs(c-o)/rng,
-            (h - np.maximum(c,o))/rng,
-            (np.minimum(c,o)-l)/rng
-        ]).T
-
-    A = feats(d1)
-    B = feats(d2)
-    struct_dist = np.mean(np.linalg.norm(A - B, axis=1))
-    struct_sim = np.exp(-1.2 * struct_dist)
-
-    # 4. TREND
-    g1 = np.gradient(n1)
-    g2 = np.gradient(n2)
-    denom = np.linalg.norm(g1) * np.linalg.norm(g2)
-    trend_sim = (np.dot(g1, g2) / denom) if denom > 0 else 0
-    trend_sim = (trend_sim + 1) / 2
-
-    # 5. VOLATILITY REGIME
-    vol_sim = np.exp(-3 * abs(np.std(g1) - np.std(g2)))
-
-    # 6. TURNING POINT ALIGNMENT
-    turn_err = (
-        abs(np.argmax(n1)/L - np.argmax(n2)/L) +
-        abs(np.argmin(n1)/L - np.argmin(n2)/L)
-    )
-    turn_sim = np.exp(-5 * turn_err)
-
-    # FINAL FUSION (0-100)
-    final = (
-        0.25 * shape_sim +
-        0.20 * dtw_sim +
-        0.20 * struct_sim +
-        0.15 * trend_sim +
-        0.10 * vol_sim +
-        0.10 * turn_sim
-    ) * 100
+# Inf sentinels in the DP matrix rule out the nnan/ninf fastmath flags
+_DTW_FASTMATH = {'nsz', 'arcp', 'contract', 'afn', 'reassoc'}
 
-    return {
-        "final": round(float(final), 2),
-        "shape": round(float(shape_sim * 100), 2),
-        "dtw": round(float(dtw_sim * 100), 2),
-        "structure": round(float(struct_sim * 100), 2),
-        "trend": round(float(trend_sim * 100), 2),
-        "volatility": round(float(vol_sim * 100), 2),
-        "turning": round(float(turn_sim * 100), 2)
-    }
+# Pattern-matching math runs in float32: prices carry 4-6 significant digits and
+# scores are reported to 2 decimals, so the halved bandwidth costs no accuracy
+@njit('float32(float32[::1], float32[::1], int64)', cache=True, fastmath=_DTW_FASTMATH)
+def dtw_band(x, y, r):
+    """Exact DTW distance between equal-length series within a Sakoe-Chiba band of radius r"""
+    n = x.shape[0]
+    # Two rolling rows of the (n+1, n+1) cost matrix
+    prev = np.full(n + 1, np.inf, dtype=np.float32)
+    curr = np.full(n + 1, np.inf, dtype=np.float32)
+    prev[0] = 0.0
+    for i in range(1, n + 1):
+        lo = max(1, i - r)
+        hi = min(n, i + r)
+        # Left of the band; cells further out are never read
+        curr[lo - 1] = np.inf
+        for j in range(lo, hi + 1):
+            curr[j] = abs(x[i - 1] - y[j - 1]) + min(prev[j], curr[j - 1], prev[j - 1])
+        prev, curr = curr, prev
+    return prev[n]
+
+@njit(cache=True, fastmath=True)
+def structure_feats(o, h, l, c):
+    """Body, upper-shadow and lower-shadow ratios of each candle's range, shape (n, 3)"""
+    n = c.shape[0]
+    out = np.empty((n, 3), dtype=np.float32)
+    for i in range(n):
+        rng = h[i] - l[i] + np.float32(1e-9)
+        out[i, 0] = abs(c[i] - o[i]) / rng
+        out[i, 1] = (h[i] - max(c[i], o[i])) / rng
+        out[i, 2] = (min(c[i], o[i]) - l[i]) / rng
+    return out
 
-def normalize_window(array):
-    """Normalizes a window of prices to 0-1 scale"""
-    min_val = np.min(array)
-    max_val = np.max(array)
-    if max_val == min_val:
-        return np.zeros(array.shape)
-    return (array - min_val) / (max_val - min_val)
+# Column order of score_windows output; the extra last column holds the LB_Keogh bound
+MMPS_SIM_KEYS = ('shape', 'structure', 'trend', 'volatility', 'turning')
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _score_windows(c, feats, n, q_norm, q_feats, q_upper, q_lower):
+    """Non-DTW MMPS similarities (0-1) and LB_Keogh bound of each close window against the query
+
+    Window s covers c[s:s+W] and candles feats[s:s+W]. Each window is min-max
+    normalized on the fly, so no (n, W) matrix is materialized. Windows are scored
+    in parallel; NUMBA_NUM_THREADS caps the worker count.
+    """
+    W = q_norm.shape[0]
+    out = np.empty((n, 6))
+
+    # Query gradient (np.gradient edge handling), its norm and mean, and the query's
+    # turning points in one pass
+    q_grad = np.empty(W)
+    qg_sq = 0.0
+    qg_sum = 0.0
+    q_imax = 0
+    q_imin = 0
+    for i in range(W):
+        if q_norm[i] > q_norm[q_imax]:
+            q_imax = i
+        if q_norm[i] < q_norm[q_imin]:
+            q_imin = i
+        if i == 0:
+            g = q_norm[1] - q_norm[0]
+        elif i == W - 1:
+            g = q_norm[W - 1] - q_norm[W - 2]
+        else:
+            g = (q_norm[i + 1] - q_norm[i - 1]) * 0.5
+        q_grad[i] = g
+        qg_sq += g * g
+        qg_sum += g
+    q_std = np.sqrt(max(qg_sq / W - (qg_sum / W) ** 2, 0.0))
+
+    for s in prange(n):
+        # Pass 1: range and turning points (argmax/argmin survive min-max scaling)
+        imax = 0
+        imin = 0
+        for i in range(1, W):
+            if c[s + i] > c[s + imax]:
+                imax = i
+            if c[s + i] < c[s + imin]:
+                imin = i
+        mn = c[s + imin]
+        inv = 1.0 / (c[s + imax] - mn + 1e-9)
+
+        # Pass 2: everything else on the normalized values
+        shape_sq = 0.0
+        lb = 0.0
+        struct = 0.0
+        dot = 0.0
+        g_sq = 0.0
+        g_sum = 0.0
+        for i in range(W):
+            v = (c[s + i] - mn) * inv
+            d = v - q_norm[i]
+            shape_sq += d * d
+            if v > q_upper[i]:
+                lb += v - q_upper[i]
+            elif v < q_lower[i]:
+                lb += q_lower[i] - v
+
+            d0 = feats[s + i, 0] - q_feats[i, 0]
+            d1 = feats[s + i, 1] - q_feats[i, 1]
+            d2 = feats[s + i, 2] - q_feats[i, 2]
+            struct += np.sqrt(d0 * d0 + d1 * d1 + d2 * d2)
+
+            # Same edge handling as np.gradient
+            if i == 0:
+                g = (c[s + 1] - c[s]) * inv
+            elif i == W - 1:
+                g = (c[s + W - 1] - c[s + W - 2]) * inv
+            else:
+                g = (c[s + i + 1] - c[s + i - 1]) * 0.5 * inv
+            dot += g * q_grad[i]
+            g_sq += g * g
+            g_sum += g
+
+        # 1. SHAPE (Euclidean, normalized)
+        out[s, 0] = np.exp(-1.5 * np.sqrt(shape_sq))
+        # 3. STRUCTURE (body/upper/lower)
+        out[s, 1] = np.exp(-1.2 * struct / W)
+        # 4. TREND
+        denom = np.sqrt(g_sq * qg_sq)
+        trend = dot / denom if denom > 0 else 0.0
+        out[s, 2] = (trend + 1) / 2
+        # 5. VOLATILITY REGIME
+        g_std = np.sqrt(max(g_sq / W - (g_sum / W) ** 2, 0.0))
+        out[s, 3] = np.exp(-3 * abs(g_std - q_std))
+        # 6. TURNING POINT ALIGNMENT
+        out[s, 4] = np.exp(-5 * (abs(imax - q_imax) + abs(imin - q_imin)) / W)
+        # LB_Keogh lower bound of the banded DTW distance
+        out[s, 5] = lb
+    return out
+
+# numba's fallback workqueue threading layer (no TBB/OpenMP installed) aborts the
+# process if two threads launch a parallel kernel at once, so launches take turns
+_SCORE_WINDOWS_LOCK = threading.Lock()
+
+def score_windows(c, feats, n, q_norm, q_feats, q_upper, q_lower):
+    """Score windows with the parallel kernel, one caller at a time"""
+    with _SCORE_WINDOWS_LOCK:
+        return _score_windows(c, feats, n, q_norm, q_feats, q_upper, q_lower)
+
+# Compile at import so the first request doesn't pay the JIT cost
+_warm = np.zeros(8, dtype=np.float32)
+score_windows(_warm, structure_feats(_warm, _warm, _warm, _warm), 1, _warm,
+              np.zeros((8, 3), dtype=np.float32), _warm, _warm)
+
+# MMPS fusion weights (sum to 1)
+MMPS_WEIGHTS = {
+    'shape': 0.25,
+    'dtw': 0.20,
+    'structure': 0.20,
+    'trend': 0.15,
+    'volatility': 0.10,
+    'turning': 0.10,
+}
+_SIM_WEIGHTS = np.array([MMPS_WEIGHTS[k] for k in MMPS_SIM_KEYS])
+OHLC_COLUMNS = ['open', 'high', 'low', 'close']
+
+def _keogh_envelope(query_norm, r):
+    """Upper/lower LB_Keogh envelope of the query for a Sakoe-Chiba band of radius r"""
+    padded = np.pad(query_norm, r, mode='edge')
+    envelope = sliding_window_view(padded, 2 * r + 1)
+    return envelope.max(axis=1), envelope.min(axis=1)
+
+def _normalize_windows(c):
+    """Min-max normalize close windows over the last axis"""
+    mn = c.min(axis=-1, keepdims=True)
+    mx = c.max(axis=-1, keepdims=True)
+    out = c - mn
+    out *= 1.0 / (mx - mn + 1e-9)
+    return out
+
+def _mmps_result(sims, i, dtw_sim):
+    """Fuse the component similarities of candidate i into the 0-100 MMPS breakdown"""
+    parts = dict(zip(MMPS_SIM_KEYS, sims[i, :len(MMPS_SIM_KEYS)].tolist()))
+    parts['dtw'] = float(dtw_sim)
+    final = sum(MMPS_WEIGHTS[k] * parts[k] for k in MMPS_WEIGHTS) * 100
+
+    result = {"final": round(float(final), 2)}
+    for k in MMPS_WEIGHTS:
+        result[k] = round(parts[k] * 100, 2)
+    return result
+
+def mmps_similarity(o1, h1, l1, c1, o2, h2, l2, c2):
+    """Multi-Metric Pattern Similarity (MMPS) between two OHLC windows - Returns score 0-100
+
+    Takes 1-D arrays, so slices of pre-extracted column arrays are passed as zero-copy
+    views. Both windows are aligned on their last min(len) bars.
+    """
+    L = min(len(c1), len(c2))
+    # Query bars then candidate bars in one float32 block: one cast, one feature pass
+    ohlc = np.array([np.concatenate((q[-L:], c[-L:]))
+                     for q, c in zip((o1, h1, l1, c1), (o2, h2, l2, c2))], dtype=np.float32)
+    feats = structure_feats(*ohlc)
+    q_norm = _normalize_windows(ohlc[3, :L])
+    c_close = ohlc[3, L:]
+
+    # No pruning for a single pair, so a zero-width envelope stands in for LB_Keogh
+    sims = score_windows(c_close, feats[L:], 1, q_norm, feats[:L], q_norm, q_norm)
+
+    # 2. DTW (exact, Sakoe-Chiba banded)
+    dtw_dist = dtw_band(q_norm, _normalize_windows(c_close), max(2, L // 10))
+    return _mmps_result(sims, 0, np.exp(-0.5 * dtw_dist))
+
+@njit(cache=True)
+def _wilder_seed(close, period):
+    """Average gain and loss over the first period changes (needs more than period bars)"""
+    avg_gain = 0.0
+    avg_loss = 0.0
+    for i in range(1, period + 1):
+        delta = close[i] - close[i - 1]
+        if delta > 0:
+            avg_gain += delta
+        else:
+            avg_loss -= delta
+    return avg_gain / period, avg_loss / period
+
+@njit(cache=True)
+def _wilder_step(avg_gain, avg_loss, delta, period):
+    """Fold one more close-to-close change into the Wilder-smoothed averages"""
+    gain = delta if delta > 0 else 0.0
+    loss = -delta if delta < 0 else 0.0
+    return ((avg_gain * (period - 1) + gain) / period,
+            (avg_loss * (period - 1) + loss) / period)
+
+@njit(cache=True)
+def _wilder_rsi(avg_gain, avg_loss):
+    """RSI from the smoothed average gain and loss"""
+    return 100 - 100 / (1 + avg_gain / (avg_loss + 1e-10))
+
+@njit(cache=True)
+def rsi_wilder_series(close, period=14):
+    """Wilder-smoothed RSI at every bar (NaN until there are period changes)"""
+    n = close.shape[0]
+    rsi = np.full(n, np.nan)
+    if n <= period:
+        return rsi
+
+    avg_gain, avg_loss = _wilder_seed(close, period)
+    rsi[period] = _wilder_rsi(avg_gain, avg_loss)
+    for i in range(period + 1, n):
+        avg_gain, avg_loss = _wilder_step(avg_gain, avg_loss, close[i] - close[i - 1], period)
+        rsi[i] = _wilder_rsi(avg_gain, avg_loss)
+
+    return rsi
+
+@njit(cache=True)
+def rsi_wilder(close, period=14):
+    """Latest Wilder-smoothed RSI of a close series (50 until there are period changes)"""
+    n = close.shape[0]
+    if n <= period:
+        return 50.0
+
+    # Same steps as rsi_wilder_series, without keeping every bar's value
+    avg_gain, avg_loss = _wilder_seed(close, period)
+    for i in range(period + 1, n):
+        avg_gain, avg_loss = _wilder_step(avg_gain, avg_loss, close[i] - close[i - 1], period)
+
+    return _wilder_rsi(avg_gain, avg_loss)
 
 def compute_rsi(series: pd.Series, period: int = 14) -> pd.Series:
     """Calculate RSI indicator"""
-    delta = series.diff()
-    gain = delta.clip(lower=0).rolling(window=period, min_periods=period).mean()
-    loss = (-delta.clip(upper=0)).rolling(window=period, min_periods=period).mean()
-    rs = gain / (loss + 1e-10)
-    rsi = 100 - (100 / (1 + rs))
-    return rsi.fillna(50)
+    rsi = rsi_wilder_series(series.to_numpy(np.float64), period)
+    return pd.Series(rsi, index=series.index).fillna(50)
+
+@lru_cache(maxsize=512)
+def _indicator_snapshot(close_bytes: bytes, volume_bytes: bytes) -> Dict:
+    """Latest indicator values for a close/volume history, memoized on the raw float64 bytes"""
+    close = np.frombuffer(close_bytes)
+    volume = np.frombuffer(volume_bytes)
+    n = len(close)
+    pct = np.diff(close) / close[:-1]
+
+    return {
+        "current_price": close[-1],
+        "sma_20": close[-20:].mean(),
+        "sma_50": close[-50:].mean(),
+        "rsi_14": rsi_wilder(close, 14),
+        "change_1d": pct[-1] * 100 if n >= 2 else 0.0,
+        "volatility": pct[-20:].std(ddof=1) * np.sqrt(252) * 100 if n >= 20 else 0.0,
+        "volume_ratio": volume[-1] / volume[-20:].mean() if n >= 20 else 1.0,
+    }
+
+def _query_window(c, window_size):
+    """Normalized latest window and DTW band the search scores candidates against"""
+    return _normalize_windows(c[-window_size:]), max(2, window_size // 10)
+
+@lru_cache(maxsize=64)
+def _window_scores(ohlc_bytes: bytes, window_size: int):
+    """MMPS scores of every candidate window against the latest one, memoized on the raw float32 OHLC bytes
+
+    Returns (sims, partial, upper): the per-component scores with the LB_Keogh bound in
+    the last column, the weighted score without DTW, and that score's DTW-bounded cap.
+    """
+    o, h, l, c = np.frombuffer(ohlc_bytes, dtype=np.float32).reshape(4, -1).copy()
+    max_start_idx = len(c) - 2 * window_size
+    q_norm, band = _query_window(c, window_size)
+    
+    # Score every candidate window, plus its LB_Keogh bound, in one fused kernel pass
+    feats = structure_feats(o, h, l, c)
+    sims = score_windows(c, feats, max_start_idx, q_norm, feats[-window_size:],
+                         *_keogh_envelope(q_norm, band))
+    partial = sims[:, :len(MMPS_SIM_KEYS)] @ _SIM_WEIGHTS
+    
+    # DTW is the expensive term. LB_Keogh lower-bounds the DTW distance, which
+    # caps each candidate's final score; visit candidates by that cap and stop
+    # once it can't beat the worst score kept in the top_n.
+    upper = partial + MMPS_WEIGHTS['dtw'] * np.exp(-0.5 * sims[:, -1])
+    
+    # Shared between requests, so guard against in-place edits
+    for arr in (sims, partial, upper):
+        arr.flags.writeable = False
+    return sims, partial, upper
+
+# Forward-return horizons reported after a pattern (label -> trading days)
+RETURN_HORIZONS = {'1d': 1, '3d': 3, '5d': 5, '7d': 7, '10d': 10}
 
 # ==========================================
 # PATTERN ENGINE
@@ -686,61 +790,63 @@ def compute_rsi(series: pd.Series, period: int = 14) -> pd.Series:
 class EnhancedPatternEngine:
     """Enhanced Pattern Recognition Engine"""
     
+    __slots__ = ('lookback_days',)
+    
     def __init__(self, lookback_days: int = 30):
         self.lookback_days = lookback_days
 
     def find_most_similar_pattern(self, df, window_size=30, top_n=5):
         """Finds windows most similar to the last 'window_size' days"""
         if len(df) < (2 * window_size):
-            return pd.DataFrame()
-        
-        target_prices = df['close'].values[-window_size:]
-        norm_target = normalize_window(target_prices)
+            return []
         
-        results = []
         max_start_idx = len(df) - (2 * window_size)
+        if max_start_idx <= 0:
+            return []
         
-        for i in range(max_start_idx):
-            history_window = df['close'].values[i : i + window_size]
-            norm_history = normalize_window(history_window)
-            
-            query_df_slice = df.iloc[-window_size:].copy()
-            cand_df_slice = df.iloc[i:i+window_size].copy()
-            mmps = mmps_similarity(query_df_slice, cand_df_slice)
-            mmps_score = mmps["final"]
-            
+        # Requests on an unchanged history (e.g. a different top_n) reuse the window scores
+        ohlc = np.stack([df[k].to_numpy(np.float32) for k in OHLC_COLUMNS])
+        c = ohlc[3]
+        q_norm, band = _query_window(c, window_size)
+        sims, partial, upper = _window_scores(ohlc.tobytes(), window_size)
+        
+        # partial alone is a floor on the final score, so anything capped below the
+        # top_n-th best floor is out before sorting
+        k = min(top_n, max_start_idx)
+        floor = np.partition(partial, max_start_idx - k)[max_start_idx - k]
+        viable = np.flatnonzero(upper >= floor)
+        
+        best = []
+        for i in viable[np.argsort(-upper[viable])]:
+            if len(best) == top_n and upper[i] <= best[0][0]:
+                break
+            cand_norm = _normalize_windows(c[i:i + window_size])
+            dtw_sim = np.exp(-0.5 * dtw_band(q_norm, cand_norm, band))
+            entry = (partial[i] + MMPS_WEIGHTS['dtw'] * dtw_sim, int(i), dtw_sim)
+            if len(best) < top_n:
+                heapq.heappush(best, entry)
+            else:
+                heapq.heappushpop(best, entry)
+        
+        ranked = sorted(best, reverse=True)
+        
+        # Format only the reported start/end dates, in one vectorized call
+        idx = np.array([i for _, i, _ in ranked])
+        dates = df['date'].iloc[np.concatenate([idx, idx + window_size - 1])].dt.strftime('%Y-%m-%d').to_numpy()
+        
+        results = []
+        for k, (_, i, dtw_sim) in enumerate(ranked):
+            mmps = _mmps_result(sims, i, dtw_sim)
             results.append({
-                'start_idx': int(i),
-                'mmps': float(mmps_score),
+                'start_idx': i,
+                'mmps': float(mmps["final"]),
                 'mmps_components': mmps,
-                'start_date': df['date'].iloc[i].strftime('%Y-%m-%d'),
-                'end_date': df['date'].iloc[i+window_size-1].strftime('%Y-%m-%d'),
+                'start_date': dates[k],
+                'end_date': dates[len(ranked) + k],
             })
 
-        results_df = pd.DataFrame(results).sort_values('mmps', ascending=False)
-        return results_df.head(top_n)
+        return results
 
-    def find_similar_patterns(self, df: pd.DataFrame, top_n: int = 5) -> Dict:
-        """Main pattern matching function"""
-        if df is None or len(df) < self.lookback_days + 30 + 10:
-            return self._empty_result("Not enough historical data")
-        
-        matches_df = self.find_most_similar_pattern(df, window_size=self.lookback_days, top_n=top_n)
-        
-        if matches_df.empty:
-            return self._empty_result("No patterns found")
-        
-        matches = matches_df.to_dict('records')
-        predictions = self._calculate_predictions(matches)
-        analysis = self._generate_analysis(matches, predictions)
-        
-        return {
-            'matches': matches,
-            'predictions': predictions,
-            'analysis': analysis,
-            'debug_info': {'method': 'Enhanced MMPS'}
-        }
-    
     def _empty_result(self, reason: str) -> Dict:
         return {
             'matches': [], 
@@ -748,18 +854,26 @@ class EnhancedPatternEngine:
             'analysis': {'signal': 'NEUTRAL', 'confidence': 0, 'reason': reason},
             'debug_info': {'error': reason}
         }
+    
     def find_similar_patterns(self, df: pd.DataFrame, top_n: int = 5) -> Dict:
         """Main pattern matching function"""
         if df is None or len(df) < self.lookback_days + 30 + 10:
             return self._empty_result("Not enough historical data")
         
-        matches_df = self.find_most_similar_pattern(df, window_size=self.lookback_days, top_n=top_n)
+        matches = self.find_most_similar_pattern(df, window_size=self.lookback_days, top_n=top_n)
         
-        if matches_df.empty:
+        if not matches:
             return self._empty_result("No patterns found")
         
-        matches = matches_df.to_dict('records')
-        predictions = self._calculate_predictions(matches, df)  # ← Pass df here
+        # Actual returns after each match feed both the predictions and the /analyze response
+        starts = np.array([m['start_idx'] for m in matches])
+        returns = future_returns_matrix(df['close'].to_numpy(np.float64), starts, self.lookback_days)
+        has_end = starts + self.lookback_days < len(df)
+        for match, row, ok in zip(matches, np.round(returns, 2).tolist(), has_end):
+            match['future_returns'] = {
+                period: None if np.isnan(r) else r for period, r in zip(RETURN_HORIZONS, row)
+            } if ok else None
+        predictions = self._calculate_predictions(returns)
         analysis = self._generate_analysis(matches, predictions)
         
         return {
@@ -768,42 +882,39 @@ class EnhancedPatternEngine:
             'analysis': analysis,
             'debug_info': {'method': 'Enhanced MMPS'}
         }
-    def _calculate_predictions(self, matches: List[Dict], df: pd.DataFrame) -> Dict:
-        """Calculate REAL predictions based on historical pattern outcomes"""
-        if not matches: 
+    
+    def _calculate_predictions(self, returns: np.ndarray) -> Dict:
+        """Calculate REAL predictions from the returns that followed each historical match
+
+        returns is (n_matches, n_horizons), NaN where a match has no future data yet.
+        """
+        if len(returns) == 0: 
             return {}
         
-        predictions = {}
-        horizons = {'1d': 1, '3d': 3, '5d': 5, '7d': 7, '10d': 10}
+        periods = list(RETURN_HORIZONS)
+        counts = np.count_nonzero(~np.isnan(returns), axis=0)
+        positives = np.count_nonzero(returns > 0, axis=0)
+        
+        # Reduce only the horizons with data so the nan-reductions never see an all-NaN column
+        has_data = counts > 0
+        valid = returns[:, has_data]
+        reduced = {
+            'mean': np.nanmean(valid, axis=0),
+            'median': np.nanmedian(valid, axis=0),
+            'std': np.nanstd(valid, axis=0),
+            'min': np.nanmin(valid, axis=0),
+            'max': np.nanmax(valid, axis=0),
+        }
+        reduced = {k: np.round(v, 2) for k, v in reduced.items()}
         
-        for period, days in horizons.items():
-            returns_list = []
-            
-            # Collect actual historical returns for each match
-            for match in matches:
-                start_idx = match['start_idx']
-                window_size = self.lookback_days
-                pattern_end_idx = start_idx + window_size
-                
-                # Check if we have future data
-                future_idx = pattern_end_idx + days
-                if future_idx < len(df):
-                    base_price = df['close'].iloc[pattern_end_idx]
-                    future_price = df['close'].iloc[future_idx]
-                    return_pct = ((future_price - base_price) / base_price) * 100
-                    returns_list.append(return_pct)
-            
-            # Calculate statistics from REAL historical returns
-            if returns_list:
-                predictions[period] = {
-                    'mean': round(float(np.mean(returns_list)), 2),
-                    'median': round(float(np.median(returns_list)), 2),
-                    'std': round(float(np.std(returns_list)), 2),
-                    'min': round(float(np.min(returns_list)), 2),
-                    'max': round(float(np.max(returns_list)), 2),
-                    'count': len(returns_list),
-                    'positive_rate': round(sum(1 for r in returns_list if r > 0) / len(returns_list) * 100, 1)
-                }
+        predictions = {}
+        col = 0
+        for j, period in enumerate(periods):
+            if has_data[j]:
+                predictions[period] = {k: float(v[col]) for k, v in reduced.items()}
+                predictions[period]['count'] = int(counts[j])
+                predictions[period]['positive_rate'] = round(positives[j] / counts[j] * 100, 1)
+                col += 1
             else:
                 # No future data available for this horizon
                 predictions[period] = {
@@ -841,6 +952,27 @@ class EnhancedPatternEngine:
 # STOCK ANALYZER
 # ==========================================
 
+# Parsed /history frames keyed by (api_base_url, symbol, period, interval)
+HISTORY_CACHE_TTL = 300
+_history_cache = TTLCache(maxsize=256, ttl=HISTORY_CACHE_TTL)
+_history_cache_lock = threading.Lock()
+# ETag -> frame of the last full response, kept past the TTL so expired entries
+# can be revalidated with a conditional GET
+_history_etags = LRUCache(maxsize=256)
+
+HISTORY_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+def history_to_frame(records):
+    """Build the date-sorted OHLCV frame straight from column arrays of the API records"""
+    n = len(records)
+    dates = np.array([r['date'] for r in records], dtype='datetime64[s]')
+    order = np.argsort(dates, kind='stable')
+    columns = {'date': dates[order]}
+    for field in HISTORY_FIELDS:
+        values = np.fromiter((r[field] for r in records), dtype=np.float64, count=n)
+        columns[field] = values[order]
+    return pd.DataFrame(columns)
+
 class StockAnalyzer:
     def __init__(self, api_base_url):
         self.api_base_url = api_base_url
@@ -853,31 +985,53 @@ class StockAnalyzer:
         # Only analyze recent data (last lookback_days)
         recent_df = df.tail(lookback_days).reset_index(drop=True)
         
-        # Initialize detector
-        detector = CandlestickPatternDetector()
-        
         # Detect all patterns
-        all_patterns = detector.detect_all_patterns(recent_df)
+        all_patterns = _DETECTOR.detect_all_patterns(recent_df)
         
         # Sort by date (most recent first)
         all_patterns.sort(key=lambda x: x['date'], reverse=True)
         
         return all_patterns
-    def fetch_data(self, symbol, period="1y", interval="1d"):
-        """Fetch stock data from external API"""
+    async def fetch_data(self, symbol, period="1y", interval="1d", force_refresh=False):
+        """Fetch stock data from external API (cached for HISTORY_CACHE_TTL seconds)"""
+        key = (self.api_base_url, symbol, period, interval)
+        if not force_refresh:
+            with _history_cache_lock:
+                cached = _history_cache.get(key)
+            if cached is not None:
+                return cached.copy()
+        
         try:
             url = f"{self.api_base_url}/history"
             params = {"symbol": symbol, "period": period, "interval": interval}
-            response = requests.get(url, params=params, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            with _history_cache_lock:
+                validator = _history_etags.get(key)
+            headers = {"If-None-Match": validator[0]} if validator else {}
+            if http_client is not None:
+                response = await http_client.get(url, params=params, headers=headers)
+            else:
+                async with httpx.AsyncClient(timeout=30) as client:
+                    response = await client.get(url, params=params, headers=headers)
             
-            if not data.get('data'): 
-                return None
+            if response.status_code == 304 and validator:
+                # Unchanged upstream; reuse the frame parsed last time
+                df = validator[1]
+            else:
+                response.raise_for_status()
+                data = response.json()
+                
+                if not data.get('data'): 
+                    return None
+                
+                df = history_to_frame(data['data'])
+                etag = response.headers.get("ETag")
+                if etag:
+                    with _history_cache_lock:
+                        _history_etags[key] = (etag, df)
             
-            df = pd.DataFrame(data['data'])
-            df['date'] = pd.to_datetime(df['date'])
-            return df.sort_values('date').reset_index(drop=True)
+            with _history_cache_lock:
+                _history_cache[key] = df
+            return df.copy()
         except Exception as e:
             print(f"Error fetching data: {e}")
             return None
@@ -887,18 +1041,10 @@ class StockAnalyzer:
         if df is None or df.empty: 
             return {}
         
-        close = df['close']
-        volume = df['volume']
-        
-        return {
-            "current_price": float(close.iloc[-1]),
-            "sma_20": float(close.tail(20).mean()),
-            "sma_50": float(close.tail(50).mean() if len(df) >= 50 else close.mean()),
-            "rsi_14": float(compute_rsi(close, 14).iloc[-1]),
-            "change_1d": float(((close.iloc[-1] - close.iloc[-2]) / close.iloc[-2] * 100) if len(df) >= 2 else 0),
-            "volatility": float(close.pct_change().tail(20).std() * np.sqrt(252) * 100 if len(df) >= 20 else 0),
-            "volume_ratio": float(volume.iloc[-1] / volume.tail(20).mean() if len(df) >= 20 else 1),
-        }
+        # Repeat requests for an unchanged history hit the snapshot cache
+        close = df['close'].to_numpy(np.float64)
+        volume = df['volume'].to_numpy(np.float64)
+        return dict(_indicator_snapshot(close.tobytes(), volume.tobytes()))
 
 # ==========================================
 # AI ANALYSIS
@@ -942,10 +1088,11 @@ Be specific with numbers and provide clear recommendations."""
         
         chain = prompt | llm
         
-        # Test the chain
-        print("Testing LangChain connection...")
-        test_response = chain.invoke({"input": "Reply with 'OK' if you can read this."})
-        print(f"LangChain test successful: {test_response.content[:50]}")
+        # Test the chain (an extra LLM round-trip, so only when debugging)
+        if os.getenv("DEBUG_LANGCHAIN") == "1":
+            print("Testing LangChain connection...")
+            test_response = chain.invoke({"input": "Reply with 'OK' if you can read this."})
+            print(f"LangChain test successful: {test_response.content[:50]}")
         
         return chain
         
@@ -954,6 +1101,19 @@ Be specific with numbers and provide clear recommendations."""
         import traceback
         traceback.print_exc()
         return None
+
+_CHAIN = None
+_CHAIN_LOCK = threading.Lock()
+
+def get_chain():
+    """Shared LangChain chain, built on first use and reused across requests"""
+    global _CHAIN
+    if _CHAIN is None:
+        with _CHAIN_LOCK:
+            if _CHAIN is None:
+                _CHAIN = init_langchain()
+    return _CHAIN
+
 def build_pattern_context(stock_data):
     """Build rich context for LLM analysis"""
     if not stock_data:
@@ -995,13 +1155,10 @@ def build_pattern_context(stock_data):
     
     return "\n".join(context_parts)
 
-def get_ai_insights(stock_data):
+async def get_ai_insights(stock_data, chain):
     """Generate AI insights from pattern data with robust error handling"""
     print("\n=== Starting AI Analysis ===")
     
-    # Initialize chain
-    chain = init_langchain()
-    
     if not chain:
         error_msg = "AI not configured. Check environment variables: azure_endpoint, api_key"
         print(f"ERROR: {error_msg}")
@@ -1039,7 +1196,7 @@ Keep the analysis concise, specific, and actionable."""
     
     try:
         print("Invoking AI model...")
-        response = chain.invoke({"input": expert_prompt})
+        response = await chain.ainvoke({"input": expert_prompt})
         print(f"AI response received: {len(response.content)} characters")
         
         return {
@@ -1057,15 +1214,19 @@ Keep the analysis concise, specific, and actionable."""
             "error": error_msg,
             "analysis": f"AI analysis failed: {str(e)}"
         }
-def get_match_ai_insight(match, idx, symbol, chain):
-    """Get AI insight for individual pattern match"""
+MATCH_HEADER = re.compile(r'^\s*=+\s*MATCH\s+(\d+)\s*=+\s*$', re.IGNORECASE | re.MULTILINE)
+
+async def get_match_insights_batch(matches, symbol, chain):
+    """Get AI insights for all pattern matches with a single LLM call"""
+    if not matches:
+        return []
+    
     if not chain:
-        return "AI analysis unavailable - credentials not configured."
+        return ["AI analysis unavailable - credentials not configured."] * len(matches)
     
-    try:
-        match_context = f"""Analyze this specific pattern match:
-
-Match #{idx+1} for {symbol}
+    match_blocks = []
+    for idx, match in enumerate(matches):
+        match_blocks.append(f"""Match #{idx+1} for {symbol}
 - Date Range: {match['start_date']} to {match['end_date']}
 - Similarity Score: {match['mmps']:.1f}%
 
@@ -1073,45 +1234,165 @@ Pattern Components:
 - Shape Similarity: {match['mmps_components']['shape']:.1f}%
 - Trend Similarity: {match['mmps_components']['trend']:.1f}%
 - Structure Similarity: {match['mmps_components']['structure']:.1f}%
-- DTW Score: {match['mmps_components']['dtw']:.1f}%
+- DTW Score: {match['mmps_components']['dtw']:.1f}%""")
+    
+    headers = ", ".join(f"=== MATCH {i} ===" for i in range(1, len(matches) + 1))
+    batch_context = f"""Analyze these specific pattern matches:
+
+{chr(10).join(match_blocks)}
 
-Provide a brief 2-3 sentence analysis of what this pattern match suggests for future price movement."""
+For each match, provide a brief 2-3 sentence analysis of what the pattern match suggests for future price movement.
+Start each analysis on its own line with its header, in order: {headers}"""
+    
+    try:
+        response = await chain.ainvoke({"input": batch_context})
+        
+        # Split on the headers: [preamble, n1, text1, n2, text2, ...]
+        parts = MATCH_HEADER.split(response.content)
+        insights = {int(n): text.strip() for n, text in zip(parts[1::2], parts[2::2])}
         
-        response = chain.invoke({"input": match_context})
-        return response.content
+        return [
+            insights.get(idx + 1) or "Analysis unavailable for this match: missing from AI response"
+            for idx in range(len(matches))
+        ]
         
     except Exception as e:
-        print(f"ERROR getting match insight #{idx+1}: {str(e)}")
-        return f"Analysis unavailable for this match: {str(e)}"
+        print(f"ERROR getting match insights: {str(e)}")
+        return [f"Analysis unavailable for this match: {str(e)}"] * len(matches)
 
 # ==========================================
 # FLASK ROUTES
 # ==========================================
 
-def calculate_future_returns(df, start_idx, window_size):
-    """Calculate actual historical returns after a pattern occurred"""
-    returns = {}
-    horizons = {'1d': 1, '3d': 3, '5d': 5, '7d': 7, '10d': 10}
+def future_returns_matrix(close, start_idxs, window_size):
+    """Percent returns RETURN_HORIZONS days after each pattern ends, NaN past the data"""
+    n = len(close)
+    ends = np.asarray(start_idxs) + window_size
+    future = ends[:, None] + np.array(list(RETURN_HORIZONS.values()))
+    base = close[np.minimum(ends, n - 1)][:, None]
+    return np.where(future < n, (close[np.minimum(future, n - 1)] - base) / base * 100, np.nan)
+
+def run_candlestick_stages(analyzer, df):
+    """Detect, validate and summarize candlestick patterns for fetched data"""
+    # 3. Detect classical candlestick patterns
+    print("Detecting candlestick patterns...")
+    candlestick_patterns = analyzer.detect_candlestick_patterns(df, lookback_days=90)
     
-    pattern_end_idx = start_idx + window_size
+    # 4. Validate patterns with volume and trend
+    print("Validating patterns...")
+    validated_patterns = _VALIDATOR.validate_patterns(candlestick_patterns, df)
     
-    if pattern_end_idx >= len(df):
-        return None
+    # 5. Calculate pattern statistics
+    print("Calculating pattern statistics...")
+    pattern_stats = calculate_pattern_statistics(validated_patterns, df)
     
-    base_price = df['close'].iloc[pattern_end_idx]
+    # Get recent patterns only (last 30 days)
+    recent_patterns = [p for p in validated_patterns if p['index'] >= len(df) - 30]
+    return validated_patterns, pattern_stats, recent_patterns
+
+async def run_analysis(analyzer, df, symbol, period, lookback, top_n):
+    """Run pattern matching, candlestick detection and AI insights for fetched data"""
+    print(f"\n=== Analyzing {symbol} ===")
+    print(f"Data points: {len(df)}")
+    loop = asyncio.get_running_loop()
     
-    for period, days in horizons.items():
-        future_idx = pattern_end_idx + days
-        if future_idx < len(df):
-            future_price = df['close'].iloc[future_idx]
-            returns[period] = round(((future_price - base_price) / base_price) * 100, 2)
-        else:
-            returns[period] = None
+    # 1. Run similarity-based pattern analysis (CPU-bound, kept off the event loop)
+    pattern_result = await loop.run_in_executor(
+        None, analyzer.pattern_engine.find_similar_patterns, df, top_n
+    )
+    
+    # 2. Calculate technical indicators
+    indicators = analyzer.calculate_indicators(df)
+    
+    # Prepare stock data for AI (the context only reads indicators and similarity results)
+    stock_data = {
+        'symbol': symbol,
+        'indicators': indicators,
+        'pattern_result': pattern_result,
+        'lookback_days': lookback
+    }
+    
+    # One shared chain serves both the report and the match insights
+    chain = get_chain()
+    
+    # LLM calls are awaited on the event loop, so no thread is held per round-trip;
+    # the candlestick stages run on a worker thread in the meantime
+    print(f"Generating AI insights for {symbol}...")
+    ai_insights, match_insights, (validated_patterns, pattern_stats, recent_patterns) = await asyncio.gather(
+        get_ai_insights(stock_data, chain),
+        get_match_insights_batch(pattern_result['matches'], symbol, chain),
+        loop.run_in_executor(None, run_candlestick_stages, analyzer, df),
+    )
+    
+    # Build enhanced matches with future returns and AI insights
+    enhanced_matches = []
+    for idx, match in enumerate(pattern_result['matches']):
+        enhanced_matches.append({
+            "rank": idx + 1,
+            "score": match['mmps'],
+            "mmps": match['mmps'],
+            "start_date": match['start_date'],
+            "end_date": match['end_date'],
+            "mmps_components": match['mmps_components'],
+            "future_returns": match['future_returns'],
+            "ai_insight": match_insights[idx]
+        })
     
-    return returns
+    # Lower-case each recent pattern type once for the summary counts
+    recent_types = [p['type'].lower() for p in recent_patterns]
+    
+    # Build comprehensive response
+    response = {
+        "symbol": symbol,
+        "period": period,
+        "lookback_days": lookback,
+        "timestamp": datetime.now().isoformat(),
+        
+        "indicators": indicators,
+        
+        "analysis": {
+            "signal": pattern_result['analysis'].get('signal', 'NEUTRAL'),
+            "confidence": pattern_result['analysis'].get('confidence', 0),
+            "mean_similarity": pattern_result['analysis'].get('mean_similarity', 0),
+            "reason": pattern_result['analysis'].get('reason', ''),
+        },
+        
+        # Similarity-based matches
+        "similarity_matches": enhanced_matches,
+        
+        # NEW: Classical candlestick patterns
+        "candlestick_patterns": {
+            "recent": recent_patterns[:10],  # Last 10 recent patterns
+            "all": validated_patterns,
+            "statistics": pattern_stats,
+            "summary": {
+                "total_detected": len(validated_patterns),
+                "bullish": sum('bullish' in t for t in recent_types),
+                "bearish": sum('bearish' in t for t in recent_types),
+                "confirmed": sum(bool(p['confirmation']) for p in recent_patterns)
+            }
+        },
+        
+        
+        "ai_report": ai_insights.get('analysis'),
+        "ai_error": ai_insights.get('error'),
+        
+        "predictions": pattern_result.get('predictions', {}),
+        
+        "metadata": {
+            "total_similarity_matches": len(enhanced_matches),
+            "total_candlestick_patterns": len(validated_patterns),
+            "avg_similarity": round(np.mean([m['score'] for m in enhanced_matches]), 2) if enhanced_matches else 0,
+            "generated_at": datetime.now().isoformat(),
+            "ai_configured": chain is not None
+        }
+    }
+    
+    print(f"✓ Analysis complete for {symbol}")
+    return response
 
 @app.route('/analyze', methods=['GET'])
-def analyze_stock():
+async def analyze_stock():
     """
     Enhanced endpoint with TRUE candlestick pattern recognition
     Parameters:
@@ -1119,6 +1400,7 @@ def analyze_stock():
     - period: Time period (1mo, 3mo, 6mo, 1y, 2y, 5y)
     - lookback: Pattern length in days (5-90)
     - top_n: Number of matches to return (1-20)
+    - force_refresh: 1/true to bypass the cached price history
     """
     try:
         # Get parameters
@@ -1126,13 +1408,14 @@ def analyze_stock():
         period = request.args.get('period', '6mo')
         lookback = int(request.args.get('lookback', 30))
         top_n = int(request.args.get('top_n', 5))
+        force_refresh = request.args.get('force_refresh', 'false').lower() in ('1', 'true')
         
         # Validate parameters
         if lookback < 5 or lookback > 90:
-            return jsonify({"error": "Lookback must be between 5 and 90 days"}), 400
+            return jresp({"error": "Lookback must be between 5 and 90 days"}, 400)
         
         if top_n < 1 or top_n > 20:
-            return jsonify({"error": "top_n must be between 1 and 20"}), 400
+            return jresp({"error": "top_n must be between 1 and 20"}, 400)
         
         # Initialize analyzer
         api_url =  "https://33trpk9t-5500.inc1.devtunnels.ms"
@@ -1140,156 +1423,53 @@ def analyze_stock():
         analyzer.pattern_engine = EnhancedPatternEngine(lookback_days=lookback)
         
         # Fetch data
-        df = analyzer.fetch_data(symbol, period=period, interval="1d")
+        df = await analyzer.fetch_data(symbol, period=period, interval="1d", force_refresh=force_refresh)
         
         if df is None or len(df) == 0:
-            return jsonify({"error": f"Failed to fetch data for {symbol}"}), 404
-        
-        print(f"\n=== Analyzing {symbol} ===")
-        print(f"Data points: {len(df)}")
-        
-        # 1. Run similarity-based pattern analysis
-        pattern_result = analyzer.pattern_engine.find_similar_patterns(df, top_n=top_n)
-        
-        # 2. Detect classical candlestick patterns
-        print("Detecting candlestick patterns...")
-        candlestick_patterns = analyzer.detect_candlestick_patterns(df, lookback_days=90)
-        
-        # 3. Validate patterns with volume and trend
-        print("Validating patterns...")
-        validator = PatternValidator()
-        validated_patterns = validator.validate_patterns(candlestick_patterns, df)
-        
-        # 4. Calculate pattern statistics
-        print("Calculating pattern statistics...")
-        pattern_stats = calculate_pattern_statistics(validated_patterns, df)
-        
-        # 5. Calculate technical indicators
-        indicators = analyzer.calculate_indicators(df)
-        
-        
-        # Get recent patterns only (last 30 days)
-        recent_patterns = [p for p in validated_patterns if p['index'] >= len(df) - 30]
-        
-        # Prepare stock data for AI
-        stock_data = {
-            'symbol': symbol,
-            'indicators': indicators,
-            'pattern_result': pattern_result,
-            'candlestick_patterns': recent_patterns,
-            'pattern_stats': pattern_stats,
-            'lookback_days': lookback
-        }
-        
-        # Get AI insights
-        print(f"Generating AI insights for {symbol}...")
-        ai_insights = get_ai_insights(stock_data)
-        
-        # Initialize chain for match insights
-        chain = init_langchain()
-        
-        # Build enhanced matches with future returns and AI insights
-        enhanced_matches = []
-        for idx, match in enumerate(pattern_result['matches']):
-            future_returns = calculate_future_returns(df, match['start_idx'], lookback)
-            match_ai_insight = get_match_ai_insight(match, idx, symbol, chain)
-            
-            enhanced_matches.append({
-                "rank": idx + 1,
-                "score": match['mmps'],
-                "mmps": match['mmps'],
-                "start_date": match['start_date'],
-                "end_date": match['end_date'],
-                "mmps_components": match['mmps_components'],
-                "future_returns": future_returns,
-                "ai_insight": match_ai_insight
-            })
-        
-        # Build comprehensive response
-        response = {
-            "symbol": symbol,
-            "period": period,
-            "lookback_days": lookback,
-            "timestamp": datetime.now().isoformat(),
-            
-            "indicators": indicators,
-            
-            "analysis": {
-                "signal": pattern_result['analysis'].get('signal', 'NEUTRAL'),
-                "confidence": pattern_result['analysis'].get('confidence', 0),
-                "mean_similarity": pattern_result['analysis'].get('mean_similarity', 0),
-                "reason": pattern_result['analysis'].get('reason', ''),
-            },
-            
-            # Similarity-based matches
-            "similarity_matches": enhanced_matches,
-            
-            # NEW: Classical candlestick patterns
-            "candlestick_patterns": {
-                "recent": recent_patterns[:10],  # Last 10 recent patterns
-                "all": validated_patterns,
-                "statistics": pattern_stats,
-                "summary": {
-                    "total_detected": len(validated_patterns),
-                    "bullish": sum(1 for p in recent_patterns if 'bullish' in p['type'].lower()),
-                    "bearish": sum(1 for p in recent_patterns if 'bearish' in p['type'].lower()),
-                    "confirmed": sum(1 for p in recent_patterns if p['confirmation'])
-                }
-            },
-            
-            
-            "ai_report": ai_insights.get('analysis'),
-            "ai_error": ai_insights.get('error'),
-            
-            "predictions": pattern_result.get('predictions', {}),
-            
-            "metadata": {
-                "total_similarity_matches": len(enhanced_matches),
-                "total_candlestick_patterns": len(validated_patterns),
-                "avg_similarity": round(np.mean([m['score'] for m in enhanced_matches]), 2) if enhanced_matches else 0,
-                "generated_at": datetime.now().isoformat(),
-                "ai_configured": chain is not None
-            }
-        }
+            return jresp({"error": f"Failed to fetch data for {symbol}"}, 404)
         
-        print(f"✓ Analysis complete for {symbol}")
-        response = convert_to_json_serializable(response)  # ← Add this line
-        return jsonify(response), 200
+        response = await run_analysis(analyzer, df, symbol, period, lookback, top_n)
+        return jresp(response, 200)
         
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        return jresp({"error": str(e)}, 500)
 db_config = {
     'host': '192.168.3.204',
     'user': 'cs_dev',
     'password': '1432',
     'database': 'my_stocks'
 }
+def fetch_portfolio_row(user_id):
+    """Load the stored portfolio JSON row for a user"""
+    with mysql.connector.connect(**db_config) as conn:
+        with conn.cursor(dictionary=True, buffered=True) as cursor:
+            cursor.execute("SELECT data FROM json_files WHERE id = %s", (user_id,))
+            return cursor.fetchone()
+
 @app.route('/portfolio', methods=['POST'])
-def portfolio():
+async def portfolio():
     """Get portfolio data for a user from MySQL database"""
     try:
-        data = request.get_json()
+        data = await request.get_json()
         user_id = data.get('user') if data else None
         
         if not user_id:
-            return jsonify({"error": "user parameter missing"}), 400
+            return jresp({"error": "user parameter missing"}, 400)
 
-        with mysql.connector.connect(**db_config) as conn:
-            with conn.cursor(dictionary=True, buffered=True) as cursor:
-                cursor.execute("SELECT data FROM json_files WHERE id = %s", (user_id,))
-                row = cursor.fetchone()
+        loop = asyncio.get_running_loop()
+        row = await loop.run_in_executor(None, fetch_portfolio_row, user_id)
 
         if not row:
-            return jsonify({"error": "No portfolio found"}), 404
+            return jresp({"error": "No portfolio found"}, 404)
 
         portfolio_data = json.loads(row['data'])
-        return jsonify(portfolio_data)
+        return jresp(portfolio_data)
 
     except Exception as e:
         print("ERROR in /portfolio route:\n", traceback.format_exc())
-        return jsonify({"error": str(e)}), 500
+        return jresp({"error": str(e)}, 500)
 
 @app.route("/current", methods=["GET"])
 def current_price():
@@ -1297,7 +1477,7 @@ def current_price():
     symbol = request.args.get("symbol")
     
     if not symbol:
-        return jsonify({"error": "symbol is required"}), 400
+        return jresp({"error": "symbol is required"}, 400)
 
     try:
         ticker = yf.Ticker(symbol)
@@ -1310,13 +1490,13 @@ def current_price():
             if not hist.empty:
                 current_price = float(hist['Close'].iloc[-1])
         
-        return jsonify({
+        return jresp({
             "symbol": symbol,
             "current_price": float(current_price) if current_price else None
         })
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jresp({"error": str(e)}, 500)
 
 @app.route("/history", methods=["GET"])
 def history():
@@ -1334,7 +1514,7 @@ def history():
     interval = request.args.get("interval", "1d")
     
     if not symbol:
-        return jsonify({"error": "symbol is required"}), 400
+        return jresp({"error": "symbol is required"}, 400)
     
     try:
         ticker = yf.Ticker(symbol)
@@ -1356,14 +1536,14 @@ def history():
         df = ticker.history(period=period, interval=interval)
         
         if df.empty:
-            return jsonify({
+            return jresp({
                 "error": f"No data available for {symbol} with interval={interval} and period={period}",
                 "symbol": symbol,
                 "period": period,
                 "interval": interval,
                 "data_points": 0,
                 "data": []
-            }), 404
+            }, 404)
         
         # Get OHLCV data
         df = df[["Open", "High", "Low", "Close", "Volume"]].reset_index()
@@ -1371,36 +1551,43 @@ def history():
         # Process data based on whether it's intraday or daily+
         candlestick_data = []
         
-        for _, row in df.iterrows():
+        # Check if index is Datetime (intraday) or Date (daily+)
+        if "Datetime" in df.columns:
+            times = df["Datetime"]
+            # Ensure timezone awareness
+            if times.dt.tz is None:
+                times = times.dt.tz_localize(pytz.utc)
+            times = times.dt.tz_convert(ist)
+            date_format = "%Y-%m-%d %H:%M:%S"
+        else:
+            times = df["Date"]
+            date_format = "%Y-%m-%d"
+        
+        # Format dates and epoch-millisecond timestamps for all rows at once
+        date_strs = times.dt.strftime(date_format).tolist()
+        timestamps = ((times - pd.Timestamp(0, tz=times.dt.tz)) // pd.Timedelta(milliseconds=1)).tolist()
+        
+        # Read each column once instead of boxing a Series per row
+        opens, highs, lows, closes, volumes = (
+            df[k].to_numpy() for k in ("Open", "High", "Low", "Close", "Volume"))
+        
+        for date_str, timestamp, o, h, l, c, v in zip(date_strs, timestamps, opens, highs,
+                                                      lows, closes, volumes):
             try:
-                # Check if index is Datetime (intraday) or Date (daily+)
-                if "Datetime" in row:
-                    dt = row["Datetime"]
-                    # Ensure timezone awareness
-                    if dt.tzinfo is None:
-                        dt = pytz.utc.localize(dt)
-                    dt_ist = dt.astimezone(ist)
-                    date_str = dt_ist.strftime("%Y-%m-%d %H:%M:%S")
-                    timestamp = int(dt_ist.timestamp() * 1000)
-                else:
-                    dt = row["Date"]
-                    date_str = dt.strftime("%Y-%m-%d")
-                    timestamp = int(dt.timestamp() * 1000)
-                
                 candlestick_data.append({
                     "date": date_str,
                     "timestamp": timestamp,
-                    "open": round(float(row["Open"]), 2),
-                    "high": round(float(row["High"]), 2),
-                    "low": round(float(row["Low"]), 2),
-                    "close": round(float(row["Close"]), 2),
-                    "volume": int(row["Volume"])
+                    "open": round(float(o), 2),
+                    "high": round(float(h), 2),
+                    "low": round(float(l), 2),
+                    "close": round(float(c), 2),
+                    "volume": int(v)
                 })
             except Exception as row_error:
                 print(f"Error processing row: {row_error}")
                 continue
         
-        return jsonify({
+        body = to_json_bytes({
             "symbol": symbol,
             "period": period,
             "interval": interval,
@@ -1408,20 +1595,26 @@ def history():
             "data_points": len(candlestick_data),
             "data": candlestick_data
         })
+        
+        # Tag the payload so clients can revalidate with If-None-Match and skip the re-download
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            return app.response_class(status=304, headers={"ETag": etag})
+        return app.response_class(body, 200, mimetype='application/json', headers={"ETag": etag})
     
     except Exception as e:
         print("ERROR in /history route:\n", traceback.format_exc())
-        return jsonify({
+        return jresp({
             "error": str(e),
             "symbol": symbol,
             "period": period,
             "interval": interval
-        }), 500
+        }, 500)
 
 # @app.route("/", methods=["GET"])
 # def home():
 #     """Home endpoint"""
-#     return jsonify({
+#     return jresp({
 #         "message": "Portfolio API",
 #         "endpoints": {
 #             "/portfolio": "POST - Get portfolio data",
@@ -1442,15 +1635,16 @@ def compute_indicators(hist):
     close = hist["Close"]
 
     # --- RSI (14) ---
-    delta = close.diff()
-    gain = delta.clip(lower=0)
-    loss = -delta.clip(upper=0)
-
-    avg_gain = gain.rolling(14).mean()
-    avg_loss = loss.rolling(14).mean()
-    rs = avg_gain / avg_loss
-    rsi = 100 - (100 / (1 + rs))
-    indicators["rsi_14"] = round(rsi.iloc[-1], 2)
+    # Only the latest value is reported, so average the last 14 changes directly
+    delta = np.diff(close.to_numpy(np.float64)[-15:])
+    rsi = np.nan
+    if len(delta) == 14:
+        avg_gain = np.maximum(delta, 0).mean()
+        avg_loss = np.maximum(-delta, 0).mean()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rs = avg_gain / avg_loss
+        rsi = 100 - (100 / (1 + rs))
+    indicators["rsi_14"] = round(rsi, 2)
 
     # --- MACD (12,26,9) ---
     ema12 = close.ewm(span=12, adjust=False).mean()
@@ -1464,9 +1658,10 @@ def compute_indicators(hist):
     indicators["macd_hist"] = round(hist_macd.iloc[-1], 4)
 
     # --- SMA ---
-    indicators["sma20"] = round(close.rolling(20).mean().iloc[-1], 2)
-    indicators["sma50"] = round(close.rolling(50).mean().iloc[-1], 2)
-    indicators["sma200"] = round(close.rolling(200).mean().iloc[-1], 2)
+    # Only the latest value of each is reported; average the tail (NaN while the history is shorter)
+    closes = close.to_numpy(np.float64)
+    for n in (20, 50, 200):
+        indicators[f"sma{n}"] = round(closes[-n:].mean(), 2) if len(closes) >= n else np.nan
 
     # --- EMA ---
     indicators["ema12"] = round(ema12.iloc[-1], 2)
@@ -1613,10 +1808,10 @@ def get_stock():
     fresh = request.args.get('fresh', 'false').lower() == 'true'
     
     if not stock_symbol:
-        return jsonify({
+        return jresp({
             "status": "error",
             "message": "Stock symbol not provided. Usage: /?stock=RELIANCE.NS"
-        }), 400
+        }, 400)
     
     # Normalize symbol (add .NS if not present)
     if not stock_symbol.endswith('.NS'):
@@ -1628,10 +1823,10 @@ def get_stock():
         stock_data = get_all_stock_data(stock_symbol)
         
         if not stock_data:
-            return jsonify({
+            return jresp({
                 "status": "error",
                 "message": f"Could not fetch data for {stock_symbol} from yfinance"
-            }), 404
+            }, 404)
         
     
     # If not in DB, fetch from yfinance
@@ -1639,19 +1834,19 @@ def get_stock():
     stock_data = get_all_stock_data(stock_symbol)
     
     if not stock_data:
-        return jsonify({
+        return jresp({
             "status": "error",
             "message": f"Stock {stock_symbol} not found"
-        }), 404
+        }, 404)
     
     
     stock_data['last_updated'] = datetime.now().isoformat()
     stock_data['source'] = 'yfinance'
     
-    return jsonify({
+    return jresp({
         "status": "success",
         "data": stock_data
-    }), 200
+    }, 200)
 if __name__ == '__main__':
     port = 5500
     app.run(host='0.0.0.0', port=port)
\ No newline at end of file